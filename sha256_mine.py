@@ -0,0 +1,142 @@
+import numpy as np
+import numba
+
+# Compiled Proof-of-Work search for warehouse_invetory_chain.py.
+# Importing this module fails if numba (and numpy) are not installed; the caller
+# then falls back to the hashlib search loop.
+
+# SHA-256 round constants
+K = np.array([
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2,
+], dtype=np.uint32)
+
+# SHA-256 initial hash state
+H0 = np.array([
+    0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19,
+], dtype=np.uint32)
+
+
+@numba.njit(inline='always')
+def _rotr(x, n):
+    """Rotates a 32-bit word right by n bits."""
+    return np.uint32((x >> np.uint32(n)) | (x << np.uint32(32 - n)))
+
+
+@numba.njit(cache=True, nogil=True)
+def _compress(state, words, offset, w):
+    """
+    Runs the SHA-256 compression function over words[offset:offset + 16], updating state in place.
+    All arithmetic is on uint32 values; np.uint32() wraps each sum instead of masking.
+    """
+    # Expand the whole message schedule up front so the round loop only reads from w
+    for i in range(16):
+        w[i] = words[offset + i]
+    for i in range(16, 64):
+        x = w[i - 15]
+        y = w[i - 2]
+        s0 = _rotr(x, 7) ^ _rotr(x, 18) ^ (x >> np.uint32(3))
+        s1 = _rotr(y, 17) ^ _rotr(y, 19) ^ (y >> np.uint32(10))
+        w[i] = np.uint32(w[i - 16] + s0 + w[i - 7] + s1)
+
+    a, b, c, d, e, f, g, h = state[0], state[1], state[2], state[3], state[4], state[5], state[6], state[7]
+    for i in range(64):
+        s1 = _rotr(e, 6) ^ _rotr(e, 11) ^ _rotr(e, 25)
+        ch = (e & f) ^ (~e & g)
+        t1 = np.uint32(h + s1 + ch + K[i] + w[i])
+        s0 = _rotr(a, 2) ^ _rotr(a, 13) ^ _rotr(a, 22)
+        maj = (a & b) ^ (a & c) ^ (b & c)
+        t2 = np.uint32(s0 + maj)
+        h = g
+        g = f
+        f = e
+        e = np.uint32(d + t1)
+        d = c
+        c = b
+        b = a
+        a = np.uint32(t1 + t2)
+
+    state[0] = np.uint32(state[0] + a)
+    state[1] = np.uint32(state[1] + b)
+    state[2] = np.uint32(state[2] + c)
+    state[3] = np.uint32(state[3] + d)
+    state[4] = np.uint32(state[4] + e)
+    state[5] = np.uint32(state[5] + f)
+    state[6] = np.uint32(state[6] + g)
+    state[7] = np.uint32(state[7] + h)
+
+
+@numba.njit(cache=True, nogil=True)
+def _search(midstate, words, nonce_offset, limit, start, count):
+    """
+    Tests nonces in [start, start + count).
+    midstate covers the whole 64-byte blocks of the prefix and words holds the padded rest of the
+    message as big-endian words, with the nonce bytes (at byte nonce_offset) left zero.
+    Returns (nonce, state) for the first digest <= limit, or (-1, state) if none matched.
+    """
+    # The nonce is a fixed 8 bytes, so only the 2-3 words holding it change between attempts
+    first_word = nonce_offset // 4
+    last_word = (nonce_offset + 7) // 4
+    base = words.copy()
+    state = np.empty(8, np.uint32)
+    w = np.empty(64, np.uint32)
+
+    for nonce in range(start, start + count):
+        for k in range(first_word, last_word + 1):
+            words[k] = base[k]
+        # Nonce is packed little-endian, matching struct '<Q'
+        n = nonce
+        for k in range(8):
+            byte = nonce_offset + k
+            words[byte >> 2] |= np.uint32(n & 0xFF) << np.uint32(24 - 8 * (byte & 3))
+            n >>= 8
+
+        state[:] = midstate
+        for offset in range(0, len(words), 16):
+            _compress(state, words, offset, w)
+
+        # Compare the digest with the limit word by word, most significant first
+        below = True
+        for k in range(8):
+            if state[k] != limit[k]:
+                below = state[k] < limit[k]
+                break
+        if below:
+            return nonce, state
+    return -1, state
+
+
+def search_nonces(prefix, target, start, count):
+    """
+    Compiled counterpart of the hashlib nonce search.
+    Tests nonces in [start, start + count) and returns (nonce, digest) for the first hash below
+    `target`, or None if the range has none.
+    """
+    full_blocks = len(prefix) - len(prefix) % 64
+    midstate = H0.copy()
+    w = np.empty(64, np.uint32)
+    prefix_words = np.frombuffer(prefix, '>u4', full_blocks // 4).astype(np.uint32)
+    for offset in range(0, len(prefix_words), 16):
+        _compress(midstate, prefix_words, offset, w)
+
+    # Pad the rest of the prefix plus room for the nonce into whole 64-byte blocks
+    tail = prefix[full_blocks:]
+    padded_len = (len(tail) + 8 + 1 + 8 + 63) // 64 * 64
+    padded = bytearray(padded_len)
+    padded[:len(tail)] = tail
+    padded[len(tail) + 8] = 0x80
+    padded[-8:] = ((len(prefix) + 8) * 8).to_bytes(8, 'big')
+    words = np.frombuffer(padded, '>u4').astype(np.uint32)
+
+    limit = target - 1 # Largest digest value that still qualifies
+    limit_words = np.array([(limit >> (224 - 32 * k)) & 0xFFFFFFFF for k in range(8)], np.uint32)
+    nonce, state = _search(midstate, words, len(tail), limit_words, start, count)
+    if nonce < 0:
+        return None
+    return nonce, b''.join(int(word).to_bytes(4, 'big') for word in state)
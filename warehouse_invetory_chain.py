@@ -1,54 +1,325 @@
 import hashlib
-import datetime
+import time
 import json
 import tkinter as tk
 from tkinter import ttk, messagebox, scrolledtext
-import pickle
 import os
+import math
+import multiprocessing
+import queue
+import concurrent.futures
+import struct
+import mmap
+from collections import defaultdict
+
+try:
+    import orjson # Faster JSON encoder/decoder, used when installed
+except ImportError:
+    orjson = None
 
 # --- Blockchain Components ---
 
+NONCE_BATCH_SIZE = 4096 # Nonces tested per call to _search_nonces
+MINING_SLAB_SIZE = 65536 # Nonces a mining worker reserves at a time
+WORKER_POLL_SECONDS = 0.2 # How often parallel mining checks that its workers are still alive
+PARALLEL_MINING_BITS = 16 # Below this difficulty a block is mined faster serially than by handing it to the pool
+
+# Hashed block contents: fixed header, previous hash, transactions as JSON, then the nonce
+HASH_HEADER = struct.Struct('<QIH') # index, timestamp (epoch seconds), target bits
+NONCE = struct.Struct('<Q')
+
+# Chain file record: 4-byte length, fixed header, then the transactions as JSON
+RECORD_LENGTH = struct.Struct('<I')
+BLOCK_HEADER = struct.Struct('<QIHQ32s32s') # index, timestamp (epoch seconds), target bits, nonce, previous hash, hash
+GENESIS_PREVIOUS_HASH = bytes(32)
+RETARGET_INTERVAL = 10 # Difficulty may only change at block heights that are multiples of this
+MAX_RETARGET_STEP = 4 # Most target bits a single retarget may add or remove
+MIN_CHANGE, MAX_CHANGE = -2**63, 2**63 - 1 # Quantity changes must fit in 64 bits, the most orjson encodes
+
+def _bits_to_target(target_bits):
+    """Converts a count of leading zero bits into the value a digest must stay below."""
+    return 1 << (256 - target_bits)
+
+def _meets_target(digest, target):
+    """Checks a raw digest, read as a big-endian integer, against the Proof-of-Work target."""
+    return int.from_bytes(digest, 'big') < target
+
+def _make_trial(prefix):
+    """
+    Specializes the block hash for a fixed preimage prefix.
+    Returns a function of the nonce alone that resumes from the prefix's SHA-256 midstate.
+    """
+    # Hash the fixed prefix once; each call resumes from a copy of that state
+    midstate = hashlib.sha256(prefix)
+
+    def trial(nonce, _copy=midstate.copy, _pack_nonce=NONCE.pack):
+        attempt = _copy()
+        attempt.update(_pack_nonce(nonce))
+        return attempt.digest()
+    return trial
+
+def _hashlib_search_nonces(prefix, target, start, count):
+    """
+    Tests nonces in [start, start + count) against the Proof-of-Work target.
+    Returns (nonce, digest) for the first match, or None if the range has none.
+    """
+    trial = _make_trial(prefix)
+    # Digests are 32 big-endian bytes, so comparing them as bytes orders them like integers
+    limit = (min(target, 1 << 256) - 1).to_bytes(32, 'big')
+    for nonce in range(start, start + count):
+        digest = trial(nonce)
+        if digest <= limit:
+            return nonce, digest
+    return None
+
+try:
+    # Compiled search loop, used when numba is installed (about twice as fast per nonce as hashlib)
+    from sha256_mine import search_nonces as _search_nonces
+    _search_nonces(b'', 1, 0, 1) # Load the compiled code now, so it isn't timed as part of the first mined block
+except ImportError:
+    _search_nonces = _hashlib_search_nonces
+
+def _mine_worker(next_nonce, found_event, jobs, results):
+    """
+    Worker process for parallel mining; lives as long as its MiningPool.
+    For each (prefix, target) job it reserves slabs of nonces from the shared counter until any
+    worker finds a match, then reports exactly one result: its match, or None.
+    """
+    results.put(None) # Started (and, with spawn, done importing this module) and ready to mine
+    for prefix, target in iter(jobs.get, None): # None asks the worker to exit
+        found = None
+        while found is None and not found_event.is_set():
+            with next_nonce.get_lock(): # Held only long enough to reserve the next slab
+                start = next_nonce.value
+                next_nonce.value = start + MINING_SLAB_SIZE
+            found = _search_nonces(prefix, target, start, MINING_SLAB_SIZE)
+        if found is not None:
+            found_event.set()
+        results.put(found)
+
+class MiningPool:
+    """
+    Mining processes started once and reused for every block, so a block doesn't pay for
+    starting processes (and re-importing this module) each time it is mined.
+    """
+    def __init__(self, workers):
+        self.next_nonce = multiprocessing.Value('Q', 0)
+        self.found_event = multiprocessing.Event()
+        self.jobs = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.processes = [
+            multiprocessing.Process(
+                target=_mine_worker,
+                args=(self.next_nonce, self.found_event, self.jobs, self.results),
+                daemon=True)
+            for _ in range(workers)
+        ]
+        for process in self.processes:
+            process.start()
+        self._replies() # Wait for the workers to start, so their startup isn't counted as mining time
+
+    def _replies(self):
+        """Collects one reply from every worker and returns them in arrival order."""
+        replies = []
+        while len(replies) < len(self.processes):
+            try:
+                replies.append(self.results.get(timeout=WORKER_POLL_SECONDS))
+            except queue.Empty:
+                if not all(process.is_alive() for process in self.processes):
+                    self.close() # Stop the survivors; the caller has to start a new pool
+                    raise RuntimeError("A mining worker exited unexpectedly.") from None
+        return replies
+
+    def search(self, prefix, target, start):
+        """Searches nonces from start upwards on every worker and returns the first (nonce, digest) reported."""
+        self.found_event.clear()
+        self.next_nonce.value = start
+        for _ in self.processes:
+            self.jobs.put((prefix, target))
+        # Wait for every worker's reply so none is still working on this block when the next one starts
+        return next((found for found in self._replies() if found is not None), None)
+
+    def close(self):
+        """Stops the worker processes."""
+        self.found_event.set()
+        for _ in self.processes:
+            self.jobs.put(None)
+        for process in self.processes:
+            process.join(WORKER_POLL_SECONDS)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+def _encode_transactions(transactions):
+    """Serializes transactions to canonical JSON bytes (sorted keys, no extra whitespace)."""
+    if orjson is not None:
+        return orjson.dumps(transactions, option=orjson.OPT_SORT_KEYS)
+    # Same bytes orjson produces, so hashes don't depend on which encoder is installed
+    return json.dumps(transactions, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode()
+
+def _decode_transactions(data):
+    """Parses transactions written by _encode_transactions."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _encode_block(block):
+    """Serializes a block into a length-prefixed chain file record."""
+    body = BLOCK_HEADER.pack(
+        block.index,
+        block.timestamp,
+        block.target_bits,
+        block.nonce,
+        block.previous_hash_bytes,
+        block.hash_bytes
+    ) + _encode_transactions(block.transactions)
+    return RECORD_LENGTH.pack(len(body)) + body
+
+def _decode_blocks(data):
+    """
+    Reads records from a chain file buffer up to the first one that is incomplete or unreadable.
+    Returns the blocks and the offset just past the last record that decoded.
+    """
+    blocks = []
+    offset = 0
+    while offset + RECORD_LENGTH.size <= len(data):
+        (length,) = RECORD_LENGTH.unpack_from(data, offset)
+        start = offset + RECORD_LENGTH.size
+        end = start + length
+        if end > len(data):
+            break # Partial record left by an interrupted write
+        try:
+            index, timestamp, target_bits, nonce, previous_hash_bytes, hash_bytes = BLOCK_HEADER.unpack_from(data[start:end])
+            transactions = _decode_transactions(data[start + BLOCK_HEADER.size:end])
+        except (struct.error, ValueError):
+            break # Damaged record; the caller decides what to do with the rest of the file
+        block = Block(
+            index=index,
+            timestamp=timestamp,
+            transactions=transactions,
+            previous_hash_bytes=previous_hash_bytes,
+            target_bits=target_bits,
+            nonce=nonce,
+            hash_bytes=hash_bytes # Keep the stored hash so validation can compare it
+        )
+        blocks.append(block)
+        offset = end
+    return blocks, offset
+
+def _is_partial_record(data, offset, expected_index, previous_hash_bytes):
+    """
+    Checks whether the bytes from offset to the end of data look like one interrupted append:
+    a single record cut short, rather than damaged records with more data behind them.
+    """
+    leftover = data[offset:]
+    if len(leftover) < RECORD_LENGTH.size:
+        return True
+    (length,) = RECORD_LENGTH.unpack_from(leftover)
+    if len(leftover) >= RECORD_LENGTH.size + length:
+        return False
+    body = leftover[RECORD_LENGTH.size:]
+    if len(body) < BLOCK_HEADER.size:
+        return True
+    index, _, _, _, block_previous_hash_bytes, _ = BLOCK_HEADER.unpack_from(body)
+    if index != expected_index or block_previous_hash_bytes != previous_hash_bytes:
+        return False
+    transactions = body[BLOCK_HEADER.size:]
+    # Encoded transactions never contain raw control bytes, but a following record's header would
+    if any(byte < 0x20 for byte in transactions):
+        return False
+    try:
+        _decode_transactions(transactions)
+    except ValueError:
+        return True # Cut off mid-JSON, as an interrupted write would leave it
+    return False # A complete record whose length field is wrong
+
+
 class Block:
     """Represents a single block in the blockchain."""
-    def __init__(self, index, timestamp, transactions, previous_hash, nonce=0):
+    def __init__(self, index, timestamp, transactions, previous_hash_bytes, target_bits, nonce=0, hash_bytes=None):
         self.index = index
-        self.timestamp = timestamp
+        self.timestamp = timestamp # Seconds since the Unix epoch
         self.transactions = transactions  # List of transactions in this block
-        self.previous_hash = previous_hash
+        self.previous_hash_bytes = previous_hash_bytes # Raw 32-byte digest of the previous block
+        self.target_bits = target_bits # Leading zero bits this block's hash must have
         self.nonce = nonce
-        self.hash = self.calculate_hash() # Calculate hash upon creation
+        # A stored hash is kept as-is so validation can compare it; otherwise calculate it upon creation
+        self.hash_bytes = hash_bytes if hash_bytes is not None else self.calculate_hash()
+        self.mining_time = 0.0 # Seconds the last mine_block call took, used for retargeting
+
+    @property
+    def hash(self):
+        """Hex form of the block hash, for display."""
+        return self.hash_bytes.hex()
+
+    @property
+    def previous_hash(self):
+        """Hex form of the previous block's hash."""
+        return self.previous_hash_bytes.hex()
 
     def calculate_hash(self):
-        """Calculates the SHA-256 hash of the block's contents."""
-        # Ensure transactions are consistently ordered for hashing if they are dicts
-        # For simple strings/numbers, direct json dumps is okay.
-        block_string = json.dumps({
-            "index": self.index,
-            "timestamp": str(self.timestamp), # Convert datetime to string
-            "transactions": self.transactions,
-            "previous_hash": self.previous_hash,
-            "nonce": self.nonce
-        }, sort_keys=True).encode() # sort_keys ensures consistent hash
-        return hashlib.sha256(block_string).hexdigest()
-
-    def mine_block(self, difficulty):
+        """Calculates the raw SHA-256 digest of the block's contents."""
+        # Rebuilt from the current fields so tampering is still detected
+        return hashlib.sha256(self._preimage_prefix() + NONCE.pack(self.nonce)).digest()
+
+    def _preimage_prefix(self):
+        """
+        Packs every hashed field except the nonce, which is appended last.
+        Everything except the nonce is fixed while mining, so it only needs to be packed once.
         """
-        Finds a nonce such that the block's hash starts with a certain number of zeros.
-        Simple Proof-of-Work.
+        return (
+            HASH_HEADER.pack(self.index, self.timestamp, self.target_bits)
+            + self.previous_hash_bytes
+            + _encode_transactions(self.transactions)
+        )
+
+    def mine_block(self, pool=None):
+        """
+        Finds a nonce such that the block's hash, read as an integer, is below its target.
+        Simple Proof-of-Work. With a MiningPool the search is split across its processes.
         """
-        target = '0' * difficulty
-        while not self.hash.startswith(target):
-            self.nonce += 1
-            self.hash = self.calculate_hash()
+        started = time.perf_counter()
+        target = _bits_to_target(self.target_bits)
+        if not _meets_target(self.hash_bytes, target):
+            # Everything but the nonce is fixed while mining, so serialize it only once
+            prefix = self._preimage_prefix()
+            if pool is not None:
+                self.nonce, self.hash_bytes = pool.search(prefix, target, self.nonce + 1)
+            else:
+                self._mine_serial(prefix, target)
+        self.mining_time = time.perf_counter() - started
         # print(f"Block mined: {self.hash}") # Optional: for debugging
 
+    def _mine_serial(self, prefix, target):
+        """Runs the nonce search in this process."""
+        # Work on locals; self is only written once a nonce is found
+        search = _search_nonces
+        batch_size = NONCE_BATCH_SIZE
+        # Search in fixed-size batches so the per-nonce work stays inside one tight loop
+        start = self.nonce + 1
+        found = None
+        while found is None:
+            found = search(prefix, target, start, batch_size)
+            start += batch_size
+        self.nonce, self.hash_bytes = found
+
 class Blockchain:
     """Manages the chain of blocks."""
-    def __init__(self, difficulty=2, chain_file="blockchain_data.pkl"):
+    def __init__(self, target_bits=8, chain_file="blockchain_data.chain", mining_workers=1,
+                 target_block_time=0.5, min_target_bits=1):
         self.chain_file = chain_file
         self.chain = []
+        self._saved_blocks = 0 # Number of blocks already written to chain_file
+        self._append_file = None # Kept open between saves; fsynced periodically by sync()
         self.pending_transactions = []
-        self.difficulty = difficulty # PoW difficulty
+        self.target_bits = target_bits # PoW difficulty for new blocks, as leading zero bits in the hash
+        self.min_target_bits = min(min_target_bits, target_bits) # Easiest difficulty retargeting may reach
+        self.target_block_time = target_block_time # Desired seconds of mining per block
+        self.mining_workers = mining_workers # Processes used to search for a nonce
+        self._mining_pool = None # MiningPool, started the first time a block is worth mining in parallel
+        self.inventory = defaultdict(int) # Running item_id -> quantity totals, updated as blocks are mined
+        self._valid = True # Cached validity: full check on load, then each new block as it is mined
+        self.chain_version = 0 # Bumped whenever the chain changes, so views can skip redundant redraws
 
         # Load existing chain or create genesis block
         if os.path.exists(self.chain_file):
@@ -59,11 +330,36 @@ class Blockchain:
 
     def create_genesis_block(self):
         """Creates the first block in the chain."""
-        genesis_block = Block(0, datetime.datetime.now(), "Genesis Block", "0")
+        genesis_block = Block(
+            index=0,
+            timestamp=int(time.time()),
+            transactions="Genesis Block",
+            previous_hash_bytes=GENESIS_PREVIOUS_HASH,
+            target_bits=self.target_bits
+        )
         # No mining needed for genesis usually, but we can mine it too
-        genesis_block.mine_block(self.difficulty)
+        self.mine_block(genesis_block)
         self.chain.append(genesis_block)
 
+    def mine_block(self, block):
+        """Mines a block, on the worker pool when there are several workers and the difficulty warrants it."""
+        if self.mining_workers <= 1 or block.target_bits < PARALLEL_MINING_BITS:
+            block.mine_block()
+            return
+        if self._mining_pool is None:
+            self._mining_pool = MiningPool(self.mining_workers)
+        try:
+            block.mine_block(self._mining_pool)
+        except RuntimeError:
+            self._mining_pool = None # A worker died and the pool closed itself; start a fresh one next time
+            raise
+
+    def _close_mining_pool(self):
+        """Stops the mining workers, if they were started."""
+        if self._mining_pool is not None:
+            self._mining_pool.close()
+            self._mining_pool = None
+
     def get_latest_block(self):
         """Returns the most recent block in the chain."""
         return self.chain[-1]
@@ -79,15 +375,28 @@ class Blockchain:
 
         # Basic validation (optional but good)
         try:
-            int(transaction['change']) # Check if change is numeric
-            str(transaction['item_id']) # Check if item_id is string-like
+            change = transaction['change']
+            if isinstance(change, float) and not change.is_integer():
+                raise ValueError(change)
+            change = int(change) # Store a plain int so every encoder produces the same JSON
+            item_id = str(transaction['item_id']) # Check if item_id is string-like
         except ValueError:
-            print("Error: Transaction 'change' must be a number.")
+            print("Error: Transaction 'change' must be a whole number.")
             return False
         except TypeError:
              print("Error: Transaction 'item_id' or 'change' has wrong type.")
              return False
+        if not MIN_CHANGE <= change <= MAX_CHANGE:
+            print("Error: Transaction 'change' is out of range.")
+            return False
 
+        transaction = dict(transaction, item_id=item_id, change=change)
+        # Anything left (e.g. a lone surrogate in item_id) would otherwise fail every block it is mined into
+        try:
+            _encode_transactions([transaction])
+        except (TypeError, ValueError) as e:
+            print(f"Error: Transaction can't be encoded: {e}")
+            return False
         self.pending_transactions.append(transaction)
         print(f"Transaction added: {transaction}") # Debug
         return True
@@ -101,96 +410,259 @@ class Blockchain:
             return False # Indicate nothing was mined
 
         print("Starting mining...") # Debug
+        new_block = self.create_pending_block()
+        self.mine_block(new_block)
+        return self.add_mined_block(new_block)
+
+    def create_pending_block(self):
+        """
+        Builds an unmined block holding all pending transactions.
+        The block can be mined elsewhere (e.g. off the GUI thread) and then passed to add_mined_block.
+        """
         latest_block = self.get_latest_block()
-        new_block = Block(
+        return Block(
             index=latest_block.index + 1,
-            timestamp=datetime.datetime.now(),
+            timestamp=int(time.time()),
             transactions=self.pending_transactions, # Add all pending
-            previous_hash=latest_block.hash
+            previous_hash_bytes=latest_block.hash_bytes,
+            target_bits=self.target_bits
         )
-        new_block.mine_block(self.difficulty)
+
+    def add_mined_block(self, new_block):
+        """Validates a mined block against the chain tip, then appends and saves it."""
+        if not self._valid:
+            print("Blockchain is invalid; not adding new blocks.")
+            return False
+
+        # The chain is append-only, so checking just the new block keeps the cached result valid
+        if not self.is_block_valid(new_block, self.get_latest_block()):
+            print("Mined block failed validation; not adding it to the chain.")
+            return False
 
         print(f"New block mined successfully. Hash: {new_block.hash}") # Debug
+        # Read the changes before appending, so a bad transaction can't leave a half-added block behind
+        try:
+            changes = self._transaction_changes(new_block)
+        except (TypeError, ValueError) as e:
+            print(f"Mined block has an unusable transaction ({e}); not adding it to the chain.")
+            return False
         self.chain.append(new_block)
+        self._apply_changes(changes) # Keep the running inventory current
+        self.chain_version += 1
         self.pending_transactions = [] # Clear pending transactions
         self.save_chain() # Persist the updated chain
+        self.target_bits = self._next_target_bits()
         return True # Indicate mining happened
 
+    def _next_target_bits(self):
+        """
+        Difficulty for the block after the chain tip. It only changes at retarget heights (every
+        RETARGET_INTERVAL blocks), where each doubling of the recent average mining time away from
+        target_block_time moves it by one bit, bounded by MAX_RETARGET_STEP and min_target_bits.
+        """
+        latest_block = self.get_latest_block()
+        bits = latest_block.target_bits
+        if (latest_block.index + 1) % RETARGET_INTERVAL:
+            return bits
+        # Only blocks mined in this session have a mining time; loaded blocks keep the current difficulty
+        times = [block.mining_time for block in self.chain[-RETARGET_INTERVAL:] if block.mining_time > 0]
+        if not times:
+            return bits
+        average = max(sum(times) / len(times), 1e-6) # Avoid log2(0)
+        step = round(math.log2(average / self.target_block_time))
+        step = max(-MAX_RETARGET_STEP, min(MAX_RETARGET_STEP, step))
+        # Slower than the target means fewer bits (easier); faster means more bits
+        new_bits = max(self.min_target_bits, min(255, bits - step))
+        if new_bits != bits:
+            print(f"Retargeting difficulty: {bits} -> {new_bits} bits (avg {average:.3f}s per block)") # Debug
+        return new_bits
+
     def is_chain_valid(self):
         """Validates the integrity of the blockchain."""
+        if self.chain[0].target_bits < self.min_target_bits:
+            print("Proof of Work Invalid: Genesis block is below the minimum difficulty.")
+            return False
         for i in range(1, len(self.chain)):
-            current_block = self.chain[i]
-            previous_block = self.chain[i-1]
-
-            # Check if the block's stored hash is correct
-            if current_block.hash != current_block.calculate_hash():
-                print(f"Data Tampering Detected: Block {current_block.index} hash mismatch.")
+            if not self.is_block_valid(self.chain[i], self.chain[i-1]):
                 return False
+        return True
 
-            # Check if the block points to the correct previous block
-            if current_block.previous_hash != previous_block.hash:
-                print(f"Chain Broken: Block {current_block.index} previous hash mismatch.")
-                return False
+    def is_block_valid(self, current_block, previous_block):
+        """Validates a single block against the block before it."""
+        # Check if the block's stored hash is correct
+        if current_block.hash_bytes != current_block.calculate_hash():
+            print(f"Data Tampering Detected: Block {current_block.index} hash mismatch.")
+            return False
+
+        # Check if the block points to the correct previous block
+        if current_block.previous_hash_bytes != previous_block.hash_bytes:
+            print(f"Chain Broken: Block {current_block.index} previous hash mismatch.")
+            return False
+
+        if current_block.index != previous_block.index + 1:
+            print(f"Chain Broken: Block {current_block.index} does not follow block {previous_block.index}.")
+            return False
 
-            # Check if the block's hash meets the difficulty requirement
-            if not current_block.hash.startswith('0' * self.difficulty):
-                 print(f"Proof of Work Invalid: Block {current_block.index} hash does not meet difficulty.")
-                 return False
+        # The difficulty is part of the consensus rules, not the block's own say: it stays at the
+        # previous block's value except at retarget heights, and never drops below the floor
+        allowed_step = 0 if current_block.index % RETARGET_INTERVAL else MAX_RETARGET_STEP
+        if (not self.min_target_bits <= current_block.target_bits <= 255
+                or abs(current_block.target_bits - previous_block.target_bits) > allowed_step):
+            print(f"Proof of Work Invalid: Block {current_block.index} has an unexpected difficulty.")
+            return False
+
+        # Check if the block's hash meets the difficulty requirement
+        if not _meets_target(current_block.hash_bytes, _bits_to_target(current_block.target_bits)):
+             print(f"Proof of Work Invalid: Block {current_block.index} hash does not meet difficulty.")
+             return False
 
         return True
 
+    @property
+    def inventory_snapshot(self):
+        """The live running inventory (not a copy), or None if the chain failed validation."""
+        return self.inventory if self._valid else None
+
     def get_inventory(self):
-        """Calculates the current inventory by processing all transactions."""
-        if not self.is_chain_valid():
+        """Returns the current inventory, kept up to date as blocks are mined."""
+        if not self._valid:
             messagebox.showerror("Error", "Blockchain is invalid! Inventory data may be corrupted.")
             return None # Indicate error
 
-        inventory = {}
+        # Filter out items with zero or negative stock if desired
+        # inventory = {item: qty for item, qty in self.inventory.items() if qty > 0}
+        return dict(self.inventory)
+
+    def _transaction_changes(self, block):
+        """Returns a block's transactions as (item_id, change) pairs, skipping malformed ones."""
+        # Handle potential variations if transactions are sometimes single dicts
+        block_transactions = block.transactions
+        if isinstance(block_transactions, dict): # Handle case where a block might have only one transaction stored as a dict
+             block_transactions = [block_transactions]
+        elif not isinstance(block_transactions, list):
+            print(f"Warning: Skipping block {block.index} due to unexpected transaction format: {type(block_transactions)}")
+            return [] # Skip block if format is unknown
+
+        changes = []
+        for transaction in block_transactions:
+             # Defensive check within the loop
+             if isinstance(transaction, dict) and 'item_id' in transaction and 'change' in transaction:
+                changes.append((transaction['item_id'], int(transaction['change']))) # Ensure it's an int
+             else:
+                 print(f"Warning: Skipping invalid transaction in block {block.index}: {transaction}")
+        return changes
+
+    def _apply_changes(self, changes):
+        """Folds (item_id, change) pairs into the running inventory."""
+        inventory = self.inventory
+        for item_id, change in changes:
+            inventory[item_id] += change
+
+    def _rebuild_inventory(self):
+        """Sums the changes per item over every block in the chain."""
+        self.inventory = defaultdict(int)
         # Start from block 1 (skip genesis block's string data)
         for block in self.chain[1:]:
-            # Handle potential variations if transactions are sometimes single dicts
-            block_transactions = block.transactions
-            if isinstance(block_transactions, dict): # Handle case where a block might have only one transaction stored as a dict
-                 block_transactions = [block_transactions]
-            elif not isinstance(block_transactions, list):
-                print(f"Warning: Skipping block {block.index} due to unexpected transaction format: {type(block_transactions)}")
-                continue # Skip block if format is unknown
-
-            for transaction in block_transactions:
-                 # Defensive check within the loop
-                 if isinstance(transaction, dict) and 'item_id' in transaction and 'change' in transaction:
-                    item_id = transaction['item_id']
-                    change = int(transaction['change']) # Ensure it's an int
-                    inventory[item_id] = inventory.get(item_id, 0) + change
-                 else:
-                     print(f"Warning: Skipping invalid transaction in block {block.index}: {transaction}")
-
-
-        # Filter out items with zero or negative stock if desired
-        # inventory = {item: qty for item, qty in inventory.items() if qty > 0}
-        return inventory
+            self._apply_changes(self._transaction_changes(block))
 
     def save_chain(self):
-        """Saves the current blockchain state to a file using pickle."""
+        """
+        Appends any blocks not yet on disk to the chain file. Existing records are never rewritten.
+        Data is flushed to the OS here; call sync() to force it to disk.
+        """
         try:
-            with open(self.chain_file, 'wb') as f:
-                pickle.dump(self.chain, f)
+            if self._append_file is None:
+                self._append_file = open(self.chain_file, 'ab')
+            append_file = self._append_file
+            start = append_file.tell() # End of the last complete record
+            try:
+                for block in self.chain[self._saved_blocks:]:
+                    append_file.write(_encode_block(block))
+                append_file.flush()
+            except Exception:
+                self._discard_partial_save(start)
+                raise
+            self._saved_blocks = len(self.chain)
             # print("Blockchain saved.") # Debug
         except Exception as e:
             print(f"Error saving blockchain: {e}")
             messagebox.showerror("Save Error", f"Could not save blockchain data:\n{e}")
 
+    def _discard_partial_save(self, size):
+        """
+        Cuts the chain file back to size after a failed save, so the retry doesn't append whole
+        records after a broken one. The file is reopened on the next save.
+        """
+        append_file, self._append_file = self._append_file, None
+        try:
+            append_file.close()
+        except OSError:
+            pass # Closing retries the failed flush; the truncate below drops whatever it wrote
+        try:
+            os.truncate(self.chain_file, size)
+        except OSError as e:
+            # Appending after the broken bytes would bury them mid-file, so stop adding blocks instead
+            print(f"Error rolling back a failed save: {e}")
+            self._valid = False
+
+    def sync(self):
+        """Forces appended blocks to disk. Batching this keeps fsync off the per-block save path."""
+        if self._append_file is not None:
+            try:
+                os.fsync(self._append_file.fileno())
+            except OSError as e:
+                print(f"Error syncing blockchain: {e}")
+
+    def close(self):
+        """Stops the mining workers, then syncs and closes the chain file."""
+        self._close_mining_pool()
+        if self._append_file is not None:
+            self.sync()
+            self._append_file.close()
+            self._append_file = None
+
     def load_chain(self):
         """Loads the blockchain state from a file."""
         try:
+            damaged = False # Unreadable data that isn't just an interrupted final append
             with open(self.chain_file, 'rb') as f:
-                self.chain = pickle.load(f)
+                size = os.fstat(f.fileno()).st_size
+                if size:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                        self.chain, end = _decode_blocks(data)
+                        if end < size:
+                            previous_hash_bytes = self.chain[-1].hash_bytes if self.chain else GENESIS_PREVIOUS_HASH
+                            damaged = not _is_partial_record(data, end, len(self.chain), previous_hash_bytes)
+                else:
+                    self.chain, end = [], 0
+            if end < size and not damaged:
+                # Drop a partial trailing record so new blocks are appended after the last good one
+                print(f"Discarding {size - end} bytes of incomplete data at the end of {self.chain_file}.")
+                os.truncate(self.chain_file, end)
+            self._saved_blocks = len(self.chain)
             print(f"Blockchain loaded from {self.chain_file}. Blocks: {len(self.chain)}") # Debug
             if not self.chain: # Handle empty file case
                  self.create_genesis_block()
-                 self.save_chain()
-            elif not self.is_chain_valid():
-                 messagebox.showwarning("Load Warning", "Loaded blockchain failed validation. Check data integrity.")
+                 if not damaged:
+                     self.save_chain()
+            else:
+                # Validate the full history once here; mined blocks are checked one at a time
+                self._valid = self.is_chain_valid()
+                if self._valid:
+                    # Hashes only prove blocks weren't changed, not that their transactions are usable
+                    try:
+                        self._rebuild_inventory()
+                    except (TypeError, ValueError) as e:
+                        print(f"Error building inventory: {e}")
+                        self._valid = False
+                if not self._valid:
+                     messagebox.showwarning("Load Warning", "Loaded blockchain failed validation. Check data integrity.")
+                self.target_bits = self._next_target_bits() # Resume at the persisted difficulty
+            if damaged:
+                # Leave the file untouched for inspection; marking the chain invalid stops new appends
+                print(f"Unreadable data at byte {end} of {self.chain_file}.")
+                self._valid = False
+                messagebox.showwarning("Load Warning", f"{self.chain_file} has {size - end} unreadable bytes after the last readable block.\nThe file was left unchanged; new blocks will not be added.")
 
         except FileNotFoundError:
             print("Blockchain file not found, creating new one.")
@@ -198,20 +670,31 @@ class Blockchain:
             self.save_chain()
         except Exception as e:
             print(f"Error loading blockchain: {e}")
-            messagebox.showerror("Load Error", f"Could not load blockchain data:\n{e}\nStarting fresh.")
-            # Fallback to a fresh chain if loading fails catastrophically
+            messagebox.showerror("Load Error", f"Could not load blockchain data:\n{e}\nThe file was left unchanged; new blocks will not be added.")
+            # Run on an empty in-memory chain, but never overwrite a file that may still hold good blocks
             self.chain = []
             self.pending_transactions = []
+            self.inventory = defaultdict(int)
+            self._valid = False
+            self.chain_version += 1
             self.create_genesis_block()
-            self.save_chain()
+            self._saved_blocks = len(self.chain) # Nothing in memory is ever appended to the file
 
 
 # --- GUI Application ---
 
+MINING_POLL_MS = 50 # How often the GUI checks whether background mining has finished
+SYNC_INTERVAL_MS = 5000 # How often saved blocks are fsynced to disk
+
 class InventoryApp:
     def __init__(self, root, blockchain):
         self.blockchain = blockchain
         self.root = root
+        self._last_version = -1 # chain_version the inventory display was last drawn for
+        # Mining runs on this thread so the Tk main loop stays responsive
+        self._mining_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._mining = False # True while a block is being mined in the background
+        self._close_when_mined = False # Set when the window was closed mid-mine
         self.root.title("Blockchain Inventory Tracker")
         self.root.geometry("550x450") # Adjusted size
 
@@ -248,7 +731,7 @@ class InventoryApp:
         action_frame = ttk.Frame(root)
         action_frame.pack(padx=10, pady=5, fill="x")
 
-        self.refresh_button = ttk.Button(action_frame, text="Refresh Inventory", command=self.update_inventory_display)
+        self.refresh_button = ttk.Button(action_frame, text="Refresh Inventory", command=self.refresh_inventory)
         self.refresh_button.pack(side=tk.LEFT, padx=5)
 
         # Add mine button explicitly if not mining after every transaction
@@ -261,6 +744,27 @@ class InventoryApp:
         # Load initial display
         self.update_inventory_display()
 
+        # Flush saved blocks to disk in batches, and once more when the window closes
+        self.root.after(SYNC_INTERVAL_MS, self._periodic_sync)
+        self.root.protocol("WM_DELETE_WINDOW", self._on_close)
+
+    def _periodic_sync(self):
+        self.blockchain.sync()
+        self.root.after(SYNC_INTERVAL_MS, self._periodic_sync)
+
+    def _on_close(self):
+        """Makes sure everything saved is on disk before the window goes away."""
+        if self._mining:
+            # The running job can't be interrupted, so let it finish and commit its block first
+            if messagebox.askokcancel("Mining In Progress",
+                                      "A block is still being mined. Close once it has been mined and saved?"):
+                self._close_when_mined = True
+                self.status_label.config(text="Status: Mining... (closing when finished)")
+            return
+        self._mining_executor.shutdown()
+        self.blockchain.close()
+        self.root.destroy()
+
     def _add_transaction(self, item_id, quantity_change):
         """Internal helper to add transaction and mine."""
         if not item_id:
@@ -275,7 +779,7 @@ class InventoryApp:
 
         # --- Crucial Check: Prevent removing more than available ---
         if change < 0:
-            current_inventory = self.blockchain.get_inventory()
+            current_inventory = self.blockchain.inventory_snapshot
             if current_inventory is None: # Blockchain invalid
                  self.status_label.config(text="Status: Error - Cannot validate stock.")
                  return
@@ -288,19 +792,49 @@ class InventoryApp:
         if self.blockchain.add_transaction(transaction):
             # Mine immediately after adding a transaction for simplicity
             # Alternatively, you could have a separate "Mine" button
-            mined = self.blockchain.mine_pending_transactions()
-            if mined:
-                 self.status_label.config(text=f"Status: Block mined. Stock for '{item_id}' updated.")
-                 self.update_inventory_display() # Update display
-                 self.item_id_entry.delete(0, tk.END) # Clear inputs
-                 self.quantity_entry.delete(0, tk.END)
-            else:
-                 # Should not happen if add_transaction succeeded, but defensive
-                 self.status_label.config(text="Status: Transaction added, waiting to be mined.")
+            new_block = self.blockchain.create_pending_block()
+            future = self._mining_executor.submit(self.blockchain.mine_block, new_block)
+            self._set_mining(True)
+            self.status_label.config(text="Status: Mining...")
+            self.root.after(MINING_POLL_MS, self._check_mining, future, new_block, item_id)
         else:
             messagebox.showerror("Error", "Failed to add transaction to pending list.")
             self.status_label.config(text="Status: Error adding transaction.")
 
+    def _check_mining(self, future, new_block, item_id):
+        """Polls the background mining job and commits the block on the Tk thread once it is done."""
+        if not future.done():
+            self.root.after(MINING_POLL_MS, self._check_mining, future, new_block, item_id)
+            return
+        self._set_mining(False)
+
+        error = future.exception()
+        if error is not None:
+            messagebox.showerror("Mining Error", f"Mining failed:\n{error}")
+            self.status_label.config(text="Status: Transaction added, waiting to be mined.")
+            self._close_when_mined = False # Nothing was saved, so leave closing to the user
+            return
+
+        mined = self.blockchain.add_mined_block(new_block)
+        if mined:
+             self.status_label.config(text=f"Status: Block mined. Stock for '{item_id}' updated.")
+             self.update_inventory_display() # Update display
+             self.item_id_entry.delete(0, tk.END) # Clear inputs
+             self.quantity_entry.delete(0, tk.END)
+        else:
+             # Should not happen if add_transaction succeeded, but defensive
+             self.status_label.config(text="Status: Transaction added, waiting to be mined.")
+
+        if self._close_when_mined:
+            self._on_close()
+
+    def _set_mining(self, mining):
+        """Disables the stock buttons while a block is being mined, so only one job is in flight."""
+        self._mining = mining
+        state = 'disabled' if mining else 'normal'
+        self.add_button.config(state=state)
+        self.remove_button.config(state=state)
+
 
     def add_stock(self):
         item_id = self.item_id_entry.get().strip().upper() # Standardize ID case
@@ -348,8 +882,19 @@ class InventoryApp:
     #     else:
     #          self.status_label.config(text="Status: No pending transactions to mine.")
 
-    def update_inventory_display(self):
-        """Fetch inventory from blockchain and update text area."""
+    def refresh_inventory(self):
+        """Refresh button: always redraws, so the status line is brought up to date too."""
+        self.update_inventory_display(force=True)
+
+    def update_inventory_display(self, force=False):
+        """
+        Fetch inventory from blockchain and update text area.
+        Internal redraws are skipped when nothing was mined since the last one; force (the Refresh button) always redraws.
+        """
+        if not force and self.blockchain.chain_version == self._last_version:
+            return # Nothing has been mined since the last redraw
+        self._last_version = self.blockchain.chain_version
+
         self.inventory_display.config(state='normal') # Enable writing
         self.inventory_display.delete('1.0', tk.END) # Clear previous content
 
@@ -380,11 +925,14 @@ class InventoryApp:
 
 if __name__ == "__main__":
     # --- Configuration ---
-    BLOCKCHAIN_FILE = "warehouse_inventory_chain.pkl" # Name of file
-    MINING_DIFFICULTY = 2 # Number of leading zeros
+    BLOCKCHAIN_FILE = "warehouse_inventory_chain.dat" # Name of file
+    MINING_TARGET_BITS = 20 # Number of leading zero bits; each extra bit doubles the mining work
+    MINING_MIN_TARGET_BITS = 12 # Lowest difficulty retargeting may drop to on a slow machine
+    MINING_WORKERS = os.cpu_count() or 1 # Processes used for Proof-of-Work
 
     # Initialize blockchain (loads existing or creates new)
-    inventory_blockchain = Blockchain(difficulty=MINING_DIFFICULTY, chain_file=BLOCKCHAIN_FILE)
+    inventory_blockchain = Blockchain(target_bits=MINING_TARGET_BITS, chain_file=BLOCKCHAIN_FILE, mining_workers=MINING_WORKERS,
+                                      min_target_bits=MINING_MIN_TARGET_BITS)
 
     # Set up and run the GUI
     main_window = tk.Tk()